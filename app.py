@@ -1,13 +1,19 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import plotly.express as px
 import plotly.graph_objects as go
 
 # ----------------- SETUP -----------------
 st.set_page_config(page_title="RR Grade Crossing Accident EDA", layout="wide")
 
-DATA_PATH = "data/rr_grade_crossing_accident_data_app_ready.csv.gz"
+DATA_PATH = "data/rr_grade_crossing_accident_data_app_ready.parquet"
+
+# columns shown in the sample-rows preview (keeps the websocket payload small)
+SAMPLE_COLS = [
+    "Year", "Weekday", "Hour24", "State Name", "State USPS",
+    "Total Killed Form 57", "Total Injured Form 57",
+]
 
 # Numeric State Code (FIPS) -> USPS abbreviation
 FIPS_TO_USPS = {
@@ -44,125 +50,220 @@ CENTROIDS = pd.DataFrame({
 
 # ----------------- FUNCTIONS -----------------
 
-@st.cache_data(show_spinner=False)
+# cache_resource (not cache_data): one shared reference, no per-session deep
+# hashing of the returned frame. Downstream code must treat df as read-only —
+# every filter goes through .loc[mask] views, never in-place mutation.
+@st.cache_resource(show_spinner=False)
 def load_data(path: str) -> pd.DataFrame:
     '''
-    Load the app-ready gzipped CSV and apply basic typing/cleanup.
+    Load the app-ready Parquet file (see scripts/convert_to_parquet.py).
 
-    - Converts Year, Hour24, State Code to numeric (nullable Int)
-    - Normalizes Weekday to Mon–Sun ordered categorical
-    - Adds 'State USPS' (2-letter) from numeric state codes (FIPS mapping)
+    All post-processing — normalized Weekday, State USPS, category dtypes,
+    downcast numerics — is baked into the file at conversion time and
+    restored exactly from the Parquet pandas metadata, so a cold start
+    after a server restart is this single typed read.
     '''
-    df = pd.read_csv(path, compression="gzip", low_memory=False)
+    return pd.read_parquet(path, engine="pyarrow")
 
-    # typing cleanup
-    df["Year"] = pd.to_numeric(df["Year"], errors="coerce").astype("Int64")
-    df["Hour24"] = pd.to_numeric(df["Hour24"], errors="coerce").astype("Int64")
-    df["State Code"] = pd.to_numeric(df["State Code"], errors="coerce").astype("Int64")
+@st.cache_resource(show_spinner=False)
+def get_state_labels() -> tuple:
+    '''
+    Build the sorted "State Name (XX)" dropdown labels plus a label -> USPS map.
 
-    # weekday order
-    weekday_order = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    if "Weekday" in df.columns:
-        mapping = {
-            "Monday":"Mon","Tuesday":"Tue","Wednesday":"Wed","Thursday":"Thu",
-            "Friday":"Fri","Saturday":"Sat","Sunday":"Sun"
-        }
-        df["Weekday"] = df["Weekday"].replace(mapping)
-        df["Weekday"] = pd.Categorical(df["Weekday"], categories=weekday_order, ordered=True)
-
-    # add USPS abbreviation (needed for dropdown + plotly choropleth)
-    df["State USPS"] = df["State Code"].map(
-        lambda x: FIPS_TO_USPS.get(int(x)) if pd.notna(x) else None
-    )
+    Pure function of the static df; built once per process (cache_resource,
+    so the ~50-entry dict isn't re-pickled per lookup) and reused read-only.
+    '''
+    state_ref = df[["State Name", "State USPS"]].dropna().drop_duplicates()
+    label_to_usps = {
+        f"{name} ({usps})": usps
+        for name, usps in zip(state_ref["State Name"].astype(str), state_ref["State USPS"].astype(str))
+    }
+    return sorted(label_to_usps), label_to_usps
 
-    return df
 
-def make_state_metric(df_all: pd.DataFrame, year_range, metric: str) -> pd.DataFrame:
+@st.cache_data(show_spinner=False)
+def year_bounds() -> tuple:
     '''
-    Docstring for make_state_metric
-    
-    Compute state-level totals for a given year range and metric.
+    Min/max Year of the static df for the slider, computed once instead of
+    re-scanning the full column on every rerun.
+    '''
+    if df["Year"].notna().any():
+        return int(df["Year"].min()), int(df["Year"].max())
+    return 2000, 2025
+
+
+@st.cache_data(show_spinner=False)
+def filter_df(year_range: tuple, states: tuple) -> pd.DataFrame:
+    '''
+    Filter the base dataframe by year range and selected USPS codes.
 
-    Returns a DataFrame with:
-      - State USPS (2-letter)
-      - value (int): Incidents (count) or sum of Killed/Injured
+    Closes over the module-level cached df and takes only hashable filter
+    keys, so reruns with the same filters are an O(1) cache lookup.
     '''
     y0, y1 = year_range
-    base = df_all[df_all["Year"].between(y0, y1)].copy()
-
-    if metric == "Incidents":
-        out = base.groupby("State USPS").size().reset_index(name="value")
-    elif metric == "Killed":
-        out = base.groupby("State USPS")["Total Killed Form 57"].sum(min_count=1).reset_index(name="value")
-    elif metric == "Injured":
-        out = base.groupby("State USPS")["Total Injured Form 57"].sum(min_count=1).reset_index(name="value")
-    else:
+    mask = df["Year"].between(y0, y1)
+    if states:
+        mask &= df["State USPS"].isin(states)
+    return df.loc[mask]
+
+
+@st.cache_resource(show_spinner=False)
+def metric_cubes() -> dict:
+    '''
+    Precompute one (year, state, weekday, hour) accumulation cube per metric.
+
+    The grouping dimensions are all low-cardinality, so every chart
+    aggregation reduces to a numpy slice + sum over a ~47x51x8x25 array
+    instead of a pass over the 240k rows. Index 7 on the weekday axis and
+    24 on the hour axis collect rows with a missing Weekday/Hour24, so
+    year- and state-level totals stay exact.
+
+    Returns a dict with:
+      - "cubes": metric name -> int64 ndarray [n_years, n_states, 8, 25]
+      - "year_min": year mapped to index 0 on the year axis
+      - "states": USPS codes in state-axis order
+      - "state_names": matching full state names (for the Top-N chart)
+    Rows without a valid state code (a handful) are excluded, as they were
+    by the old observed-only groupbys.
+    '''
+    sub = df.loc[df["Year"].notna() & df["State USPS"].notna()]
+
+    year_min = int(sub["Year"].min())
+    n_years = int(sub["Year"].max()) - year_min + 1
+    states = list(sub["State USPS"].cat.categories)
+
+    yr = sub["Year"].to_numpy(dtype=np.int64) - year_min
+    stc = sub["State USPS"].cat.codes.to_numpy(dtype=np.int64)
+    wd = sub["Weekday"].cat.codes.to_numpy(dtype=np.int64)
+    wd = np.where(wd < 0, 7, wd)                      # -1 (NaN) -> overflow slot
+    hr = sub["Hour24"].fillna(24).to_numpy(dtype=np.int64)
+
+    idx = (yr, stc, wd, hr)
+    shape = (n_years, len(states), 8, 25)
+
+    cubes = {}
+    inc = np.zeros(shape, dtype=np.int64)
+    np.add.at(inc, idx, 1)
+    cubes["Incidents"] = inc
+    for name, col in (("Killed", "Total Killed Form 57"), ("Injured", "Total Injured Form 57")):
+        vals = pd.to_numeric(sub[col], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        cube = np.zeros(shape, dtype=np.int64)
+        np.add.at(cube, idx, vals)
+        cubes[name] = cube
+
+    # USPS -> full name for the Top-N chart (1:1 in this dataset)
+    pairs = sub[["State USPS", "State Name"]].dropna().drop_duplicates()
+    usps_to_name = dict(zip(pairs["State USPS"].astype(str), pairs["State Name"].astype(str)))
+    state_names = [usps_to_name.get(s, s) for s in states]
+
+    return {"cubes": cubes, "year_min": year_min, "states": states, "state_names": state_names}
+
+
+def _cube_block(year_range: tuple, states: tuple, metric: str) -> np.ndarray:
+    '''
+    Select the (years, states) block of a metric cube.
+
+    Returns an ndarray [n_selected_years, n_selected_states, 8, 25].
+    '''
+    cb = metric_cubes()
+    if metric not in cb["cubes"]:
         raise ValueError("Unknown metric")
+    y0 = max(year_range[0] - cb["year_min"], 0)
+    y1 = year_range[1] - cb["year_min"]
+    block = cb["cubes"][metric][y0:y1 + 1]
+    if states:
+        sel = [i for i, s in enumerate(cb["states"]) if s in states]
+        block = block[:, sel]
+    return block
 
-    out["value"] = pd.to_numeric(out["value"], errors="coerce").fillna(0).round().astype("int64")
-    return out
 
+@st.cache_data(show_spinner=False)
+def state_all_metrics(year_range: tuple) -> pd.DataFrame:
+    '''
+    Compute state-level totals for ALL three metrics over a year range.
 
-def metric_series(df: pd.DataFrame, metric: str) -> pd.Series:
+    Users typically toggle Incidents/Killed/Injured on the same filter,
+    so one cached pass serves every metric; the per-metric view is a
+    column select. Only states with at least one incident in range are
+    returned, matching the old observed-only groupby (absent states stay
+    blank on the map).
     '''
-    Return a per-row numeric series for the selected metric.
+    cb = metric_cubes()
+    out = pd.DataFrame({
+        "State USPS": cb["states"],
+        **{m: _cube_block(year_range, (), m).sum(axis=(0, 2, 3))
+           for m in ("Incidents", "Killed", "Injured")},
+    })
+    return out.loc[out["Incidents"] > 0].reset_index(drop=True)
 
-    - Incidents -> 1 per row
-    - Killed -> 'Total Killed Form 57'
-    - Injured -> 'Total Injured Form 57'
+
+def make_state_metric(year_range: tuple, metric: str) -> pd.DataFrame:
+    '''
+    Per-metric view over state_all_metrics: State USPS + value columns.
     '''
-    if metric == "Incidents":
-        return pd.Series(1, index=df.index)
-    if metric == "Killed":
-        return pd.to_numeric(df["Total Killed Form 57"], errors="coerce").fillna(0)
-    if metric == "Injured":
-        return pd.to_numeric(df["Total Injured Form 57"], errors="coerce").fillna(0)
-    return pd.Series(1, index=df.index)
+    all_m = state_all_metrics(year_range)
+    if metric not in ("Incidents", "Killed", "Injured"):
+        raise ValueError("Unknown metric")
+    return all_m[["State USPS", metric]].rename(columns={metric: "value"})
 
 
-def plot_weekday_hour_heatmap(df: pd.DataFrame, metric: str):
+@st.cache_data(show_spinner=False)
+def weekday_hour_matrix(year_range: tuple, states: tuple, metric: str) -> pd.DataFrame:
     '''
-    Plot a Weekday × Hour24 heatmap for the selected metric.
+    Compute the Weekday × Hour24 matrix for the selected metric.
 
-    Heatmap cell values are:
+    Cell values are:
       - Incidents: count of rows
       - Killed/Injured: sum over rows
     Weekdays are ordered Mon–Sun; hours are fixed 0–23.
     '''
-    weekday_order = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    idx = pd.Index(weekday_order, name="Weekday")
+    idx = pd.Index(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], name="Weekday")
     cols = pd.Index(list(range(24)), name="Hour24")
 
-    if df.empty:
-        heat = pd.DataFrame(0, index=idx, columns=cols)
-    else:
-        tmp = df.dropna(subset=["Weekday", "Hour24"]).copy()
-        tmp["Hour24"] = tmp["Hour24"].astype(int)
-
-        if metric == "Incidents":
-            tmp["_val"] = 1
-        elif metric == "Killed":
-            tmp["_val"] = pd.to_numeric(tmp["Total Killed Form 57"], errors="coerce").fillna(0)
-        elif metric == "Injured":
-            tmp["_val"] = pd.to_numeric(tmp["Total Injured Form 57"], errors="coerce").fillna(0)
-        else:
-            tmp["_val"] = 1
-
-        heat = (
-            tmp.groupby(["Weekday", "Hour24"])["_val"]
-            .sum()
-            .unstack(fill_value=0)
-            .reindex(index=idx, columns=cols, fill_value=0)
-        )
-
-    heat = heat.round().astype(int)
-    # plot
+    # drop the missing-weekday/hour overflow slots, sum out years + states
+    heat = _cube_block(year_range, states, metric)[:, :, :7, :24].sum(axis=(0, 1))
+    return pd.DataFrame(heat, index=idx, columns=cols)
+
+
+@st.cache_data(show_spinner=False)
+def weekday_totals(year_range: tuple, states: tuple, metric: str) -> pd.Series:
+    '''
+    Compute the per-weekday total (Mon–Sun) for the selected metric.
+    '''
+    totals = _cube_block(year_range, states, metric)[:, :, :7, :].sum(axis=(0, 1, 3))
+    return pd.Series(totals, index=["Mon","Tue","Wed","Thu","Fri","Sat","Sun"], name="_val")
+
+
+@st.cache_data(show_spinner=False)
+def top_states_metric(year_range: tuple, states: tuple, metric: str, n: int) -> pd.Series:
+    '''
+    Compute the Top-N states (by name) for the selected metric, descending.
+    '''
+    cb = metric_cubes()
+    totals = _cube_block(year_range, states, metric).sum(axis=(0, 2, 3))
+    observed = _cube_block(year_range, states, "Incidents").sum(axis=(0, 2, 3)) > 0
+
+    names = cb["state_names"]
+    if states:
+        names = [nm for s, nm in zip(cb["states"], names) if s in states]
+
+    top = pd.Series(totals, index=names)
+    return top.loc[observed].sort_values(ascending=False).head(int(n))
+
+
+@st.cache_resource(show_spinner=False)
+def _heatmap_fig() -> tuple:
+    '''
+    Build the heatmap figure skeleton once per process: axes, tick labels,
+    minor grid, colorbar. Renders only swap the image data in place, which
+    skips the (surprisingly expensive) figure + tick layout on every rerun.
+    '''
+    weekday_order = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
     fig_w = 12
     fig_h = fig_w * (7 / 24)
     fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-    im = ax.imshow(heat.values, aspect="equal", cmap="YlOrRd", origin="upper")
+    im = ax.imshow(np.zeros((7, 24)), aspect="equal", cmap="YlOrRd", origin="upper")
 
-    ax.set_title(f"{metric} by Weekday × Hour (0–23)")
     ax.set_xlabel("Hour24")
     ax.set_ylabel("Weekday")
 
@@ -177,65 +278,84 @@ def plot_weekday_hour_heatmap(df: pd.DataFrame, metric: str):
     ax.tick_params(which="minor", bottom=False, left=False)
 
     cbar = fig.colorbar(im, ax=ax, fraction=0.02, pad=0.02)
+    return fig, ax, im, cbar
+
+
+def plot_weekday_hour_heatmap(heat: pd.DataFrame, metric: str):
+    '''
+    Render the (cached) Weekday × Hour24 matrix on the persistent figure.
+    '''
+    fig, ax, im, cbar = _heatmap_fig()
+    im.set_data(heat.values)
+    im.set_clim(vmin=0, vmax=float(heat.values.max()) or 1.0)
+    ax.set_title(f"{metric} by Weekday × Hour (0–23)")
     cbar.set_label(metric)
 
-    st.pyplot(fig, clear_figure=True)
+    st.pyplot(fig, clear_figure=False)
 
 
-def choropleth_selected_highlight(df_all: pd.DataFrame, picked_usps: list[str], year_range, metric: str):
+@st.cache_resource(show_spinner=False)
+def base_usa_map() -> go.Figure:
+    '''
+    Build the static part of the choropleth once per process:
+    USA scope + state abbreviation labels at the centroids, no hover.
     '''
-    Plot a USA choropleth for the selected metric.
+    fig = go.Figure()
+    # CENTROIDS columns: state, Latitude, Longitude
+    fig.add_trace(go.Scattergeo(
+        locationmode="USA-states",
+        lon=CENTROIDS["Longitude"],
+        lat=CENTROIDS["Latitude"],
+        text=CENTROIDS["state"],      # DE, CA, ...
+        mode="text",
+        textfont=dict(size=10, color="black"),
+        hoverinfo="skip",             # <-- removes lat/lon hover completely
+        showlegend=False
+    ))
+    fig.update_geos(scope="usa")
+    fig.update_layout(margin=dict(l=0, r=0, t=50, b=0))
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def choropleth_fig(year_range: tuple, picked: tuple, metric: str) -> go.Figure:
+    '''
+    Build the USA choropleth figure for the selected metric.
 
     - All states are shown for geographic context.
     - If any states are selected, only those are colored (others blank).
     - Hover shows state + metric value; state abbreviations are overlaid as text.
+    Cached on the filter keys so reruns reuse the finished figure.
     '''
     all_states = pd.DataFrame({"State USPS": list(FIPS_TO_USPS.values())})
 
-    metric_df = make_state_metric(df_all, year_range, metric)
+    metric_df = make_state_metric(year_range, metric)
     m = all_states.merge(metric_df, on="State USPS", how="left")
 
     # if some selected: blank out all unselected states
-    if picked_usps:
-        m.loc[~m["State USPS"].isin(picked_usps), "value"] = None
+    if picked:
+        m.loc[~m["State USPS"].isin(picked), "value"] = None
 
     y0, y1 = year_range
-    sel_txt = ", ".join(picked_usps) if picked_usps else "All States"
+    sel_txt = ", ".join(picked) if picked else "All States"
     title = f"{metric} by State: {sel_txt} | {y0} to {y1}"
 
-    fig = px.choropleth(
-        m,
-        locations="State USPS",
+    choro = go.Choropleth(
+        locations=m["State USPS"],
+        z=m["value"],
         locationmode="USA-states",
-        color="value",
-        scope="usa",
-        color_continuous_scale="Reds",
+        colorscale="Reds",
+        marker_line_width=0.5,
+        colorbar=dict(tickformat=",d"),
+        # hover shows only state + value
+        hovertemplate=f"<b>%{{location}}</b><br>{metric}: %{{z:,.0f}}<extra></extra>",
     )
 
-    # hover shows only state + value
-    fig.update_traces(
-    hovertemplate=f"<b>%{{location}}</b><br>{metric}: %{{z:,.0f}}<extra></extra>"
-    )
-    fig.update_coloraxes(colorbar_tickformat=",d")
-
-
-    # --- Static state labels (ALL states), no hover ---
-    # CENTROIDS columns: state, Latitude, Longitude
-    fig.add_trace(go.Scattergeo(
-        locationmode="USA-states",
-        lon=CENTROIDS["Longitude"],
-        lat=CENTROIDS["Latitude"],
-        text=CENTROIDS["state"],      # DE, CA, ...
-        mode="text",
-        textfont=dict(size=10, color="black"),
-        hoverinfo="skip",             # <-- removes lat/lon hover completely
-        showlegend=False
-    ))
-
-    fig.update_traces(marker_line_width=0.5, selector=dict(type="choropleth"))
-    fig.update_layout(title=title, margin=dict(l=0, r=0, t=50, b=0))
-
-    st.plotly_chart(fig, use_container_width=True)
+    # choropleth first so the static centroid labels render on top
+    base = base_usa_map()
+    fig = go.Figure(data=(choro, *base.data), layout=base.layout)
+    fig.update_layout(title=title)
+    return fig
 
 
 # ----------------- APP -----------------
@@ -244,33 +364,27 @@ df = load_data(DATA_PATH)
 # Sidebar controls
 st.sidebar.header("Core Filters")
 
-# year slider
-if df["Year"].notna().any():
-    year_min = int(df["Year"].min())
-    year_max = int(df["Year"].max())
-else:
-    year_min, year_max = 2000, 2025
+# year slider (bounds cached, not re-scanned per rerun)
+year_min, year_max = year_bounds()
 
 year_range = st.sidebar.slider("Year range", year_min, year_max, (year_min, year_max))
 
 # state multiselect: "State Name (DE)" labels
-state_ref = df[["State Name", "State USPS"]].dropna().drop_duplicates().copy()
-state_ref["label"] = state_ref["State Name"].astype(str) + " (" + state_ref["State USPS"].astype(str) + ")"
-state_labels = sorted(state_ref["label"].unique())
+state_labels, label_to_usps = get_state_labels()
 
 picked_state_labels = st.sidebar.multiselect("State(s)", state_labels, default=[])
 
-# extract "DE" from "(DE)"
-picked_state_usps = [s.split("(")[-1].replace(")", "").strip() for s in picked_state_labels]
+# "State Name (DE)" -> "DE" via the prebuilt map (no string parsing per rerun)
+picked_state_usps = [label_to_usps[s] for s in picked_state_labels]
 
 # dynamic title (state codes only are shown in the title to avoid messy interface)
 code_text = ", ".join(picked_state_usps) if picked_state_usps else "All States"
 st.title(f"RR Grade Crossing Accidents: {code_text} | {year_range[0]}–{year_range[1]}")
 
-# filter df for non-map charts (year + selected states)
-df_f = df[df["Year"].between(year_range[0], year_range[1])].copy()
-if picked_state_usps:
-    df_f = df_f[df_f["State USPS"].isin(picked_state_usps)]
+# filter df for non-map charts (year + selected states); cached by filter keys
+year_key = tuple(year_range)
+states_key = tuple(sorted(picked_state_usps))
+df_f = filter_df(year_key, states_key)
 
 st.caption(f"Loaded: {len(df):,} rows. After filters: {len(df_f):,} rows.")
 
@@ -294,35 +408,19 @@ st.divider()
 # --- Main chart area ---
 if demo_chart == "Choropleth":
     st.subheader("Choropleth")
-    choropleth_selected_highlight(df, picked_state_usps, year_range, metric)
+    st.plotly_chart(choropleth_fig(year_key, states_key, metric), use_container_width=True)
 
 elif demo_chart == "Week-Hour Heatmap":
     st.subheader("Week-Hour Heatmap")
-    plot_weekday_hour_heatmap(df_f, metric)
+    plot_weekday_hour_heatmap(weekday_hour_matrix(year_key, states_key, metric), metric)
 
 elif demo_chart == "Weekdays":
     st.subheader("Weekdays")
-    tmp = df_f.dropna(subset=["Weekday"]).copy()
-    tmp["_val"] = metric_series(tmp, metric)
-    wk = tmp.groupby("Weekday")["_val"].sum().reindex(["Mon","Tue","Wed","Thu","Fri","Sat","Sun"])
-    st.bar_chart(wk)
+    st.bar_chart(weekday_totals(year_key, states_key, metric))
 
 elif demo_chart == "Top States":
     st.subheader(f"Top {top_n} States")
-    base = df[df["Year"].between(year_range[0], year_range[1])].copy()
-    if picked_state_usps:
-        base = base[base["State USPS"].isin(picked_state_usps)]
-
-    base["_val"] = metric_series(base, metric)
-
-    top = (
-        base.groupby("State Name")["_val"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(int(top_n))
-    )
-    top = top.round().astype(int)
-
+    top = top_states_metric(year_key, states_key, metric, int(top_n))
 
     # Horizontal bar: #1 at top
     top_plot = top.sort_values(ascending=True)  # smallest bottom, largest top
@@ -339,8 +437,18 @@ elif demo_chart == "Top States":
 st.divider()
 st.subheader("Sample of selected data")
 
-show_sample = st.checkbox("Show sample rows", value=False)
 
-if show_sample:
-    n_rows = st.number_input("Rows to show", min_value=5, max_value=200, value=25, step=5)
-    st.dataframe(df_f.head(int(n_rows)), use_container_width=True)
\ No newline at end of file
+@st.fragment
+def sample_section(df_f: pd.DataFrame):
+    '''
+    Sample-rows preview in its own fragment: toggling the checkbox or
+    changing the row count reruns only this block, not the charts above.
+    '''
+    show_sample = st.checkbox("Show sample rows", value=False)
+
+    if show_sample:
+        n_rows = st.number_input("Rows to show", min_value=5, max_value=200, value=25, step=5)
+        st.dataframe(df_f[SAMPLE_COLS].head(int(n_rows)), use_container_width=True)
+
+
+sample_section(df_f)
\ No newline at end of file
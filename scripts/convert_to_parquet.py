@@ -0,0 +1,77 @@
+'''
+One-time conversion of the app-ready gzipped CSV to a Parquet data asset.
+
+Run from the repo root:
+
+    python scripts/convert_to_parquet.py
+
+Writes data/rr_grade_crossing_accident_data_app_ready.parquet with:
+  - Weekday normalized to a Mon-Sun ordered categorical
+  - State USPS (2-letter) derived from the numeric FIPS state code
+  - State USPS / State Name / Railroad Code as category dtype
+  - hot numerics downcast (int16 Year/casualties, Int8 Hour24/State Code)
+  - Snappy compression + dictionary encoding
+
+The dtypes round-trip exactly through the Parquet pandas metadata, so
+the app's cold start after a server restart is a single typed read with
+no post-processing pass.
+'''
+
+import pandas as pd
+
+CSV_PATH = "data/rr_grade_crossing_accident_data_app_ready.csv.gz"
+PARQUET_PATH = "data/rr_grade_crossing_accident_data_app_ready.parquet"
+
+WEEKDAY_ORDER = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+WEEKDAY_MAP = {
+    "Monday": "Mon", "Tuesday": "Tue", "Wednesday": "Wed", "Thursday": "Thu",
+    "Friday": "Fri", "Saturday": "Sat", "Sunday": "Sun"
+}
+
+# Numeric State Code (FIPS) -> USPS abbreviation (keep in sync with app.py)
+FIPS_TO_USPS = {
+    1:"AL", 2:"AK", 4:"AZ", 5:"AR", 6:"CA", 8:"CO", 9:"CT", 10:"DE", 11:"DC", 12:"FL", 13:"GA",
+    15:"HI", 16:"ID", 17:"IL", 18:"IN", 19:"IA", 20:"KS", 21:"KY", 22:"LA", 23:"ME", 24:"MD",
+    25:"MA", 26:"MI", 27:"MN", 28:"MS", 29:"MO", 30:"MT", 31:"NE", 32:"NV", 33:"NH", 34:"NJ",
+    35:"NM", 36:"NY", 37:"NC", 38:"ND", 39:"OH", 40:"OK", 41:"OR", 42:"PA", 44:"RI", 45:"SC",
+    46:"SD", 47:"TN", 48:"TX", 49:"UT", 50:"VT", 51:"VA", 53:"WA", 54:"WV", 55:"WI", 56:"WY"
+}
+
+
+def convert(csv_path: str = CSV_PATH, parquet_path: str = PARQUET_PATH) -> None:
+    '''Read the gzipped CSV, apply the typing fixups once, write Parquet.'''
+    df = pd.read_csv(csv_path, compression="gzip", low_memory=False)
+
+    # typing cleanup (done here so the app never has to)
+    df["Year"] = pd.to_numeric(df["Year"], errors="coerce").astype("Int64")
+    df["Hour24"] = pd.to_numeric(df["Hour24"], errors="coerce").astype("Int64")
+    df["State Code"] = pd.to_numeric(df["State Code"], errors="coerce").astype("Int64")
+
+    # store normalized Mon-Sun values as an ordered categorical
+    if "Weekday" in df.columns:
+        df["Weekday"] = pd.Categorical(
+            df["Weekday"].replace(WEEKDAY_MAP), categories=WEEKDAY_ORDER, ordered=True
+        )
+
+    # USPS abbreviation: vectorized map (NaN state codes propagate to NaN),
+    # stored dictionary-encoded so it loads as a categorical for free
+    df["State USPS"] = df["State Code"].map(FIPS_TO_USPS).astype("category")
+
+    # category dtype: groupbys run on integer codes instead of hashing strings
+    for c in ("State Name", "Railroad Code"):
+        df[c] = df[c].astype("category")
+
+    # downcast the hot numeric columns — their ranges fit comfortably
+    # (years ~1975-2021, hours 0-23, FIPS <= 99, casualties <= ~100)
+    df["Year"] = df["Year"].astype("int16")                 # no NaNs in this column
+    df["Hour24"] = df["Hour24"].astype("Int8")
+    df["State Code"] = df["State Code"].astype("Int8")
+    df["Total Killed Form 57"] = df["Total Killed Form 57"].fillna(0).astype("int16")
+    df["Total Injured Form 57"] = df["Total Injured Form 57"].fillna(0).astype("int16")
+
+    df.to_parquet(parquet_path, engine="pyarrow", compression="snappy")
+    print(f"Wrote {parquet_path}: {len(df):,} rows, {df.shape[1]} columns")
+
+
+if __name__ == "__main__":
+    convert()